@@ -1,62 +1,175 @@
-from flask import Flask, request, render_template, jsonify, session, Response, stream_with_context
-from email_sender import EmailSender
-from functools import wraps
+from flask import Flask, Request, request, render_template, jsonify, session, Response, stream_with_context
+from email_sender import EmailSender, THROTTLED_ERROR
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
 from datetime import datetime, timedelta
+import io
 import os
+from flask.json.provider import JSONProvider
 from werkzeug.utils import secure_filename
-import json
+from werkzeug.exceptions import HTTPException
+import orjson
+import threading
+import atexit
 from pathlib import Path
+from contextlib import contextmanager
 import shutil
+import hashlib
+import tempfile
 import csv
+import codecs
+import time
+import re
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.events import EVENT_JOB_ADDED, EVENT_JOB_REMOVED, EVENT_JOB_MODIFIED
 import pytz
 
+class OrjsonProvider(JSONProvider):
+    """JSON provider that serializes with orjson"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+# Get the directory where app.py is located
+BASE_DIR = Path(__file__).resolve().parent
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 email_sender = EmailSender()
-app.config['UPLOAD_FOLDER'] = 'temp_uploads'
+# Absolute, so upload paths stored in scheduled jobs stay valid from any working directory
+app.config['UPLOAD_FOLDER'] = str(BASE_DIR / 'temp_uploads')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+STREAM_CHUNK_SIZE = 64 * 1024  # Buffer size for raw upload streaming
+RAW_HEADER_MAX_SIZE = 64 * 1024  # Longest JSON field line accepted before a raw upload
+BULK_SEND_WORKERS = 8  # Concurrent SMTP connections per bulk send
+SESSION_STAGGER = 0.2  # Seconds between opening successive worker connections
+RECIPIENT_FIELD_PATTERN = re.compile(r'^recipients\[(\d+)\]\[(name|email)\]$')
+
+SPOOL_MAX_SIZE = 8 * 1024 * 1024  # Uploads up to this size are buffered in memory
+UPLOAD_MAX_AGE = timedelta(hours=1)  # Leftover uploads older than this are removed
 
 # Create upload folder if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Add rate limiting to prevent spam
-RATE_LIMIT = timedelta(minutes=1)  # 1 email per minute
-last_email_time = {}
-
-# Add a rate limit decorator
-def rate_limit(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        ip = request.remote_addr
-        if ip in last_email_time:
-            time_since_last = datetime.now() - last_email_time[ip]
-            if time_since_last < RATE_LIMIT:
-                return jsonify({
-                    'success': False,
-                    'message': 'Please wait before sending another email'
-                }), 429
-        last_email_time[ip] = datetime.now()
-        return f(*args, **kwargs)
-    return decorated_function
+class UploadRequest(Request):
+    """Request that keeps uploads in memory up to SPOOL_MAX_SIZE and writes
+    larger ones straight into the upload folder, so saving is a rename"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= SPOOL_MAX_SIZE:
+            return io.BytesIO()
+        return tempfile.NamedTemporaryFile('wb+', dir=app.config['UPLOAD_FOLDER'], delete=False)
+
+app.request_class = UploadRequest
+
+def save_upload(file_storage, path):
+    """Save an uploaded file, renaming its spool file into place when it is on disk"""
+    spool_name = getattr(file_storage.stream, 'name', None)
+    if isinstance(spool_name, str):
+        file_storage.stream.close()
+        shutil.move(spool_name, path)  # A rename unless the target is on another filesystem
+    else:
+        file_storage.save(path)
+
+@app.teardown_request
+def discard_spooled_uploads(exc):
+    """Remove on-disk spool files for uploads the endpoint didn't save"""
+    # Only look at files if the form was parsed; don't trigger parsing here
+    for file_storage in request.__dict__.get('files', {}).values():
+        spool_name = getattr(file_storage.stream, 'name', None)
+        if isinstance(spool_name, str):
+            file_storage.stream.close()
+            remove_upload(spool_name)
+
+def unique_upload_path(folder=None):
+    """Reserve a new, uniquely named PDF path in the upload folder"""
+    fd, path = tempfile.mkstemp(dir=folder or app.config['UPLOAD_FOLDER'], suffix='.pdf')
+    os.close(fd)
+    return path
+
+def remove_upload(path):
+    """Delete a temporary upload, ignoring files that are already gone"""
+    if path:
+        Path(path).unlink(missing_ok=True)
+
+@contextmanager
+def saved_upload(file_storage, folder=None):
+    """Save an uploaded PDF for the duration of a with-block
+
+    Yields (path, filename), where filename is the sanitized name the client
+    gave, or (None, None) when nothing (or a disallowed file type) was
+    uploaded. The file is stored under a unique name so concurrent sends never
+    share it, and is removed on exit however the block ends.
+    """
+    path = filename = None
+    try:
+        if file_storage and file_storage.filename and allowed_file(file_storage.filename):
+            filename = secure_filename(file_storage.filename)
+            path = unique_upload_path(folder)
+            save_upload(file_storage, path)
+        yield path, filename
+    finally:
+        remove_upload(path)
+
+def cleanup_upload_folder():
+    """Remove uploads older than UPLOAD_MAX_AGE that no scheduled email still needs"""
+    in_use = {os.path.abspath(job.args[3]) for job in scheduler.get_jobs(jobstore='default') if job.args[3]}
+    cutoff = time.time() - UPLOAD_MAX_AGE.total_seconds()
+    with os.scandir(app.config['UPLOAD_FOLDER']) as entries:
+        for entry in entries:
+            try:
+                if (entry.is_file() and entry.stat().st_mtime < cutoff
+                        and os.path.abspath(entry.path) not in in_use):
+                    os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+
+# Add rate limiting to prevent spam (storage: see gunicorn.conf.py)
+RATE_LIMIT = "1/minute"  # 1 email per minute
+limiter = Limiter(
+    get_remote_address,
+    app=app,
+    storage_uri=os.getenv("RATELIMIT_STORAGE_URI", "memory://"),
+    strategy="fixed-window"
+)
+# Both single-send endpoints draw from the same per-client budget
+send_email_limit = limiter.shared_limit(RATE_LIMIT, scope='send-email')
+
+@app.errorhandler(429)
+def rate_limit_exceeded(e):
+    return jsonify({
+        'success': False,
+        'message': 'Please wait before sending another email'
+    }), 429
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ['pdf', 'csv']
 
-# Get the directory where app.py is located
-BASE_DIR = Path(__file__).resolve().parent
 TEMPLATES_FILE = BASE_DIR / 'email_templates.json'
 TEMPLATE_ATTACHMENTS_DIR = BASE_DIR / 'template_attachments'
 
 # Create template attachments directory if it doesn't exist
 os.makedirs(TEMPLATE_ATTACHMENTS_DIR, exist_ok=True)
 
+TEMPLATE_FLUSH_DELAY = timedelta(seconds=2)  # Debounce window for template writes
+templates_dirty = False
+templates_lock = threading.Lock()
+
 # Load templates from file
 def load_templates():
     """Load templates from JSON file"""
     try:
         if Path(TEMPLATES_FILE).exists():
-            with open(TEMPLATES_FILE, 'r') as f:
-                templates = json.load(f)
+            with open(TEMPLATES_FILE, 'rb') as f:
+                templates = orjson.loads(f.read())
             print(f"Loaded {len(templates)} templates from {TEMPLATES_FILE}")
             return templates
         print(f"No existing templates file found at {TEMPLATES_FILE}")
@@ -67,21 +180,63 @@ def load_templates():
 
 # Save templates to file
 def save_templates(templates):
-    """Save templates to JSON file"""
+    """Atomically save templates to JSON file"""
     try:
-        with open(TEMPLATES_FILE, 'w') as f:
-            json.dump(templates, f, indent=4)
+        tmp_file = TEMPLATES_FILE.with_name(TEMPLATES_FILE.name + '.tmp')
+        with open(tmp_file, 'wb') as f:
+            f.write(orjson.dumps(templates))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, TEMPLATES_FILE)
         print(f"Saved {len(templates)} templates to {TEMPLATES_FILE}")
     except Exception as e:
         print(f"Error saving templates: {e}")
 
+def flush_templates():
+    """Write in-memory templates to disk if they changed since the last flush"""
+    global templates_dirty
+    with templates_lock:
+        if not templates_dirty:
+            return
+        templates_dirty = False
+        snapshot = dict(EMAIL_TEMPLATES)
+    save_templates(snapshot)
+
+def mark_templates_dirty():
+    """Schedule a debounced flush of EMAIL_TEMPLATES to disk"""
+    global templates_dirty
+    with templates_lock:
+        templates_dirty = True
+    scheduler.add_job(
+        flush_templates,
+        'date',
+        run_date=datetime.now() + TEMPLATE_FLUSH_DELAY,
+        id='flush-templates',
+        jobstore='memory',
+        replace_existing=True
+    )
+
 # Initialize templates
 EMAIL_TEMPLATES = load_templates()
 
-# Initialize the scheduler
-scheduler = BackgroundScheduler()
+# Initialize the scheduler. Scheduled emails live in a SQLite job store so
+# they survive restarts; transient housekeeping jobs stay in memory.
+JOBS_DB = BASE_DIR / 'jobs.sqlite'
+scheduler = BackgroundScheduler(jobstores={
+    'default': SQLAlchemyJobStore(url=f'sqlite:///{JOBS_DB}'),
+    'memory': MemoryJobStore()
+})
+# Runs in the single serving process; see gunicorn.conf.py
 scheduler.start()
-SCHEDULED_JOBS = {}  # To store scheduled email jobs
+atexit.register(flush_templates)
+scheduler.add_job(
+    cleanup_upload_folder,
+    'interval',
+    hours=1,
+    id='cleanup-uploads',
+    jobstore='memory',
+    replace_existing=True
+)
 
 @app.route('/')
 def home():
@@ -93,13 +248,35 @@ def email_form():
     """Render the email form page"""
     return render_template('email_form.html')
 
-@app.route('/send-email', methods=['POST'])
-@rate_limit
-def send_email_endpoint():
-    """Handle email sending requests from both API and form submissions"""
+def remove_job_upload(attachment_path):
+    """Delete a scheduled email's attachment if it is an upload the job owns
+
+    Template attachments are shared and kept.
+    """
+    if attachment_path and Path(attachment_path).resolve().parent == Path(app.config['UPLOAD_FOLDER']).resolve():
+        remove_upload(attachment_path)
+
+def send_scheduled_email(recipient, subject, body, attachment_path, attachment_filename=None):
+    """Send an email from a scheduler job (stored by reference in the job store)"""
+    try:
+        return email_sender.send_email(recipient, subject, body, attachment_path,
+                                       attachment_filename=attachment_filename)
+    finally:
+        remove_job_upload(attachment_path)
+
+def process_email_request(data, filename, save_attachment):
+    """Send or schedule a single email described by ``data``.
+
+    ``save_attachment`` is called with the destination path to store the
+    uploaded PDF named ``filename`` (if any).
+    """
+    attachment_path = None
+    attachment_filename = None
+    attachment_cache_key = None
+    template_attachment_path = None
+    upload_path = None
     try:
         print("Starting email send process...")
-        data = request.form
         
         recipient = data.get('recipient')
         subject = data.get('subject')
@@ -107,10 +284,6 @@ def send_email_endpoint():
         template_name = data.get('template')
         schedule_time = data.get('schedule_time')
         print(f"Using template: {template_name}")
-        
-        attachment = request.files.get('attachment')
-        attachment_path = None
-        template_attachment_path = None
 
         if not all([recipient, subject, body]):
             return jsonify({
@@ -134,21 +307,24 @@ def send_email_endpoint():
                     print(f"Template attachment found at {template_attachment_path}")
         
         # Handle PDF attachment if provided
-        if attachment and attachment.filename:
-            if not allowed_file(attachment.filename):
+        if filename:
+            if not allowed_file(filename):
                 return jsonify({
                     'success': False,
                     'message': 'Only PDF files are allowed'
                 }), 400
             
-            filename = secure_filename(attachment.filename)
-            attachment_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            attachment.save(attachment_path)
+            upload_path = unique_upload_path()
+            save_attachment(upload_path)
+            attachment_path = upload_path
+            attachment_filename = secure_filename(filename)
 
         # Use template attachment if no custom attachment is provided
         if not attachment_path and template_attachment_path and os.path.exists(template_attachment_path):
             print(f"Using template attachment: {template_attachment_path}")
             attachment_path = template_attachment_path
+            attachment_filename = template.get('attachment_filename')
+            attachment_cache_key = template_attachment_key(template)
 
         if schedule_time:
             # Convert schedule_time to datetime and validate
@@ -170,23 +346,16 @@ def send_email_endpoint():
             
             job_id = f"email_{datetime.now().timestamp()}"
             
-            # Store job info
-            SCHEDULED_JOBS[job_id] = {
-                'recipient': recipient,
-                'subject': subject,
-                'scheduled_time': schedule_datetime,
-                'attachment_path': attachment_path
-            }
-            
             # Schedule the email
             scheduler.add_job(
-                email_sender.send_email,
+                send_scheduled_email,
                 'date',
                 run_date=schedule_datetime,
-                args=[recipient, subject, body, attachment_path],
+                args=[recipient, subject, body, attachment_path, attachment_filename],
                 id=job_id,
                 misfire_grace_time=300  # 5 minutes grace time
             )
+            upload_path = None  # The scheduled job now owns the upload
             
             return jsonify({
                 'success': True,
@@ -194,11 +363,9 @@ def send_email_endpoint():
             })
         else:
             # Send email immediately
-            success, error = email_sender.send_email(recipient, subject, body, attachment_path)
-
-        # Clean up the temporary file (but not template attachments)
-        if attachment_path and attachment_path != template_attachment_path and os.path.exists(attachment_path):
-            os.remove(attachment_path)
+            success, error = email_sender.send_email(recipient, subject, body, attachment_path,
+                                                     attachment_filename=attachment_filename,
+                                                     attachment_cache_key=attachment_cache_key)
 
         if success:
             return jsonify({
@@ -211,14 +378,57 @@ def send_email_endpoint():
                 'message': error
             }), 400
 
+    except HTTPException:
+        # Let Flask answer with the proper status (e.g. 413 for an oversized upload)
+        raise
     except Exception as e:
-        # Clean up the temporary file in case of error
-        if attachment_path and os.path.exists(attachment_path):
-            os.remove(attachment_path)
         return jsonify({
             'success': False,
             'message': str(e)
         }), 500
+    finally:
+        # Clean up the temporary file (but not template attachments)
+        remove_upload(upload_path)
+
+@app.route('/send-email', methods=['POST'])
+@send_email_limit
+def send_email_endpoint():
+    """Handle email sending requests from both API and form submissions"""
+    attachment = request.files.get('attachment')
+    filename = attachment.filename if attachment else None
+    return process_email_request(request.form, filename, lambda path: save_upload(attachment, path))
+
+@app.route('/send-email-raw', methods=['POST'])
+@send_email_limit
+def send_email_raw_endpoint():
+    """Handle email sending with the PDF streamed as the raw request body.
+
+    The body starts with a single line of JSON holding the email fields
+    (recipient, subject, body, template, schedule_time, filename), followed by
+    the PDF bytes. The PDF is copied to disk in fixed-size chunks, bypassing
+    multipart parsing entirely. The attachment name may also be given in the
+    ``X-Filename`` header.
+    """
+    header = request.stream.readline(RAW_HEADER_MAX_SIZE)
+    try:
+        if not header.endswith(b'\n'):
+            raise ValueError
+        data = orjson.loads(header)
+        if not isinstance(data, dict):
+            raise ValueError
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'message': 'Request body must start with a line of JSON email fields'
+        }), 400
+
+    filename = data.get('filename') or request.headers.get('X-Filename')
+
+    def save_stream(path):
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(request.stream, f, length=STREAM_CHUNK_SIZE)
+
+    return process_email_request(data, filename, save_stream)
 
 @app.route('/get-templates')
 def get_templates():
@@ -247,9 +457,48 @@ def manage_templates():
     """Render the template management page"""
     return render_template('manage_templates.html')
 
+def hash_template_attachment(file_storage):
+    """Copy an uploaded PDF to a temporary file, returning (sha256 digest, temp path)"""
+    sha256 = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=TEMPLATE_ATTACHMENTS_DIR)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while chunk := file_storage.stream.read(STREAM_CHUNK_SIZE):
+                sha256.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        remove_upload(tmp_path)
+        raise
+    return sha256.hexdigest(), tmp_path
+
+def store_template_attachment(digest, tmp_path):
+    """Move a hashed upload to <digest>.pdf. Call with templates_lock held."""
+    attachment_path = TEMPLATE_ATTACHMENTS_DIR / f"{digest}.pdf"
+    # Identical content is already stored; keep the existing file (and its cached encoding)
+    if not attachment_path.exists():
+        os.replace(tmp_path, attachment_path)
+
+def template_attachment_key(template):
+    """Return the key a template's encoded attachment is cached under
+
+    Attachments are stored by content hash and never rewritten in place, so
+    the hash (or the stored file name for older templates) identifies the content.
+    """
+    return template.get('attachment_hash') or template.get('attachment_name')
+
+def release_template_attachment(attachment_name):
+    """Delete a template attachment file once no template refers to it.
+
+    Call with templates_lock held so no template can start using the file
+    between the check and the unlink.
+    """
+    if attachment_name and not any(t.get('attachment_name') == attachment_name for t in EMAIL_TEMPLATES.values()):
+        Path(TEMPLATE_ATTACHMENTS_DIR, attachment_name).unlink(missing_ok=True)
+
 @app.route('/save-template', methods=['POST'])
 def save_template():
     """Save a new template"""
+    tmp_path = None
     try:
         name = request.form['name']
         template = {
@@ -262,16 +511,23 @@ def save_template():
         if 'attachment' in request.files:
             attachment = request.files['attachment']
             if attachment and allowed_file(attachment.filename):
-                # Save the attachment with a unique name
-                filename = secure_filename(f"{name}_{attachment.filename}")
-                attachment_path = os.path.join(TEMPLATE_ATTACHMENTS_DIR, filename)
-                print(f"Saving template attachment to: {attachment_path}")
-                attachment.save(attachment_path)
-                template['attachment_name'] = filename
-                print(f"Template attachment saved as: {filename}")
+                # Store the attachment by content hash so identical PDFs share one file
+                digest, tmp_path = hash_template_attachment(attachment)
+                template['attachment_name'] = f"{digest}.pdf"
+                template['attachment_hash'] = digest
+                template['attachment_filename'] = secure_filename(attachment.filename)
+                print(f"Template attachment saved as: {template['attachment_name']}")
         
-        EMAIL_TEMPLATES[name] = template
-        save_templates(EMAIL_TEMPLATES)
+        # Storing, inserting and releasing together keeps a concurrent delete
+        # from unlinking a file this template is about to use
+        with templates_lock:
+            if tmp_path:
+                store_template_attachment(template['attachment_hash'], tmp_path)
+            previous = EMAIL_TEMPLATES.get(name)
+            EMAIL_TEMPLATES[name] = template
+            if previous:
+                release_template_attachment(previous.get('attachment_name'))
+        mark_templates_dirty()
         print(f"Template saved: {template}")
         
         return jsonify({
@@ -284,6 +540,8 @@ def save_template():
             'success': False,
             'message': str(e)
         }), 400
+    finally:
+        remove_upload(tmp_path)
 
 @app.route('/update-template', methods=['POST'])
 def update_template():
@@ -291,13 +549,16 @@ def update_template():
     try:
         data = request.get_json()
         name = data['name']
-        template = {
-            'subject': data['subject'],
-            'body': data['body']
-        }
         
-        EMAIL_TEMPLATES[name] = template
-        save_templates(EMAIL_TEMPLATES)
+        with templates_lock:
+            # Keep the template's attachment; only its text is edited here
+            template = {
+                **EMAIL_TEMPLATES.get(name, {}),
+                'subject': data['subject'],
+                'body': data['body']
+            }
+            EMAIL_TEMPLATES[name] = template
+        mark_templates_dirty()
         
         return jsonify({
             'success': True,
@@ -316,16 +577,13 @@ def delete_template():
         data = request.get_json()
         name = data['name']
         
-        if name in EMAIL_TEMPLATES:
-            # Delete associated attachment if it exists
-            template = EMAIL_TEMPLATES[name]
-            if template.get('attachment_name'):
-                attachment_path = os.path.join(TEMPLATE_ATTACHMENTS_DIR, template['attachment_name'])
-                if os.path.exists(attachment_path):
-                    os.remove(attachment_path)
-            
-            del EMAIL_TEMPLATES[name]
-            save_templates(EMAIL_TEMPLATES)
+        with templates_lock:
+            template = EMAIL_TEMPLATES.pop(name, None)
+            if template:
+                # Delete associated attachment if no other template uses it
+                release_template_attachment(template.get('attachment_name'))
+        if template:
+            mark_templates_dirty()
         
         return jsonify({
             'success': True,
@@ -348,12 +606,81 @@ def debug_templates():
         'attachments': os.listdir(TEMPLATE_ATTACHMENTS_DIR) if os.path.exists(TEMPLATE_ATTACHMENTS_DIR) else []
     })
 
+def send_concurrently(items, send_item, workers=BULK_SEND_WORKERS):
+    """Run send_item(item, smtp) for each item on a bounded thread pool.
+
+    Each worker thread lazily opens and reuses its own SMTP session. Yields
+    (item, future) pairs in completion order. If the server answers 421
+    (too many connections) the other sessions are closed once idle, the rest
+    of the batch is sent one at a time over a single session and the
+    throttled item is retried once.
+    """
+    local = threading.local()
+    sessions = []
+    sessions_lock = threading.Lock()
+    throttled = False
+
+    def run(item, serial):
+        if serial:
+            # Submitted after every other send finished, so nothing else uses it
+            return send_item(item, sessions[0])
+        smtp = getattr(local, 'smtp', None)
+        if smtp is None:
+            with sessions_lock:
+                # Stagger new connections so they don't all log in at once
+                delay = len(sessions) * SESSION_STAGGER
+                smtp = local.smtp = email_sender.open_session()
+                sessions.append(smtp)
+            time.sleep(delay)
+        return send_item(item, smtp)
+
+    items = iter(items)
+    retries = deque()
+    pending = {}
+    limit = workers
+    exhausted = False
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                # Once throttled, switch to one connection only when every worker is idle
+                serial = throttled and not pending and bool(sessions)
+                if serial and len(sessions) > 1:
+                    for smtp in sessions[1:]:
+                        smtp.close()
+                    del sessions[1:]
+                while len(pending) < limit and (retries or not exhausted):
+                    if retries:
+                        item, retried = retries.popleft(), True
+                    else:
+                        try:
+                            item, retried = next(items), False
+                        except StopIteration:
+                            exhausted = True
+                            break
+                    pending[executor.submit(run, item, serial)] = (item, retried)
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item, retried = pending.pop(future)
+                    if (not retried and future.exception() is None
+                            and future.result() == (False, THROTTLED_ERROR)):
+                        throttled = True
+                        limit = 1
+                        retries.append(item)
+                        continue
+                    yield item, future
+    finally:
+        for smtp in sessions:
+            smtp.close()
+
 @app.route('/bulk-email')
 def bulk_email():
     """Render the bulk email page"""
     return render_template('bulk_email.html')
 
 @app.route('/send-bulk-email', methods=['POST'])
+@limiter.limit(RATE_LIMIT)
 def send_bulk_email():
     def generate():
         try:
@@ -361,113 +688,150 @@ def send_bulk_email():
             excel_file = request.files.get('excelFile')
             attachment = request.files.get('attachment')
             
-            # Read CSV file
-            csv_content = excel_file.read().decode('utf-8')
-            csv_reader = csv.DictReader(csv_content.splitlines())
-            rows = list(csv_reader)
-            total_emails = len(rows)
+            # Stream CSV rows straight from the upload; a first pass only counts them
+            csv_stream = excel_file.stream
+            total_emails = sum(1 for _ in csv.DictReader(codecs.iterdecode(csv_stream, 'utf-8')))
+            csv_stream.seek(0)
+            rows = csv.DictReader(codecs.iterdecode(csv_stream, 'utf-8'))
             
-            # Save attachment if provided
-            attachment_path = None
-            if attachment and attachment.filename:
-                if allowed_file(attachment.filename):
-                    filename = secure_filename(attachment.filename)
-                    attachment_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                    attachment.save(attachment_path)
-
-            # Get template
-            template = EMAIL_TEMPLATES.get(template_name)
-            if not template:
-                yield json.dumps({
-                    'status': {'success': False, 'message': 'Template not found'}
-                }) + '\n'
-                return
+            # Save attachment if provided; it is removed when the block exits
+            with saved_upload(attachment) as (attachment_path, attachment_filename):
+                # Get template
+                template = EMAIL_TEMPLATES.get(template_name)
+                if not template:
+                    yield orjson.dumps({
+                        'status': {'success': False, 'message': 'Template not found'}
+                    }) + b'\n'
+                    return
 
-            # Process each email
-            for index, row in enumerate(rows):
-                try:
+                subject = template['subject']
+                # Split the body around [name] once so personalizing is a single join
+                body_parts = template['body'].split('[name]')
+
+                # Get template attachment
+                template_attachment = None
+                if template.get('attachment_name'):
+                    template_attachment = os.path.join(
+                        TEMPLATE_ATTACHMENTS_DIR, 
+                        template['attachment_name']
+                    )
+
+                # Use custom attachment or template attachment
+                final_attachment = attachment_path or template_attachment
+                final_filename = attachment_filename if attachment_path else template.get('attachment_filename')
+                cache_key = None if attachment_path else template_attachment_key(template)
+
+                # Build the message parts once; only personalized bodies are re-encoded
+                message = email_sender.message_template(subject, template['body'], final_attachment,
+                                                        final_filename, cache_key)
+
+                def send_row(row, smtp):
                     email = row['email']
                     name = row.get('name', '')
-                    
-                    # Personalize subject and body
-                    subject = template['subject']
-                    body = template['body']
-                    if name:
-                        body = body.replace('[name]', name)
-                    
-                    # Get template attachment
-                    template_attachment = None
-                    if template.get('attachment_name'):
-                        template_attachment = os.path.join(
-                            TEMPLATE_ATTACHMENTS_DIR, 
-                            template['attachment_name']
-                        )
-                    
-                    # Use custom attachment or template attachment
-                    final_attachment = attachment_path or template_attachment
-                    
-                    # Send email
-                    success, error = email_sender.send_email(
+
+                    # Personalize body
+                    body = name.join(body_parts) if name and len(body_parts) > 1 else None
+
+                    return email_sender.send_from_template(
+                        message,
                         recipient=email,
-                        subject=subject,
                         body=body,
-                        attachment_path=final_attachment
+                        session=smtp
                     )
+
+                # Process each email
+                for index, (row, future) in enumerate(send_concurrently(rows, send_row)):
+                    try:
+                        success, error = future.result()
+                        email = row['email']
                     
-                    # Report status
-                    status_message = f"Email to {email}: {'Success' if success else error}"
-                    yield json.dumps({
-                        'progress': ((index + 1) / total_emails) * 100,
-                        'current': index + 1,
-                        'total': total_emails,
-                        'status': {
-                            'success': success,
-                            'message': status_message
-                        }
-                    }) + '\n'
+                        # Report status
+                        status_message = f"Email to {email}: {'Success' if success else error}"
+                        yield orjson.dumps({
+                            'progress': ((index + 1) / total_emails) * 100,
+                            'current': index + 1,
+                            'total': total_emails,
+                            'status': {
+                                'success': success,
+                                'message': status_message
+                            }
+                        }) + b'\n'
                     
-                except Exception as e:
-                    yield json.dumps({
-                        'status': {
-                            'success': False,
-                            'message': f"Error processing {email}: {str(e)}"
-                        }
-                    }) + '\n'
-
-            # Clean up temporary attachment
-            if attachment_path and os.path.exists(attachment_path):
-                os.remove(attachment_path)
+                    except Exception as e:
+                        yield orjson.dumps({
+                            'status': {
+                                'success': False,
+                                'message': f"Error processing {row.get('email', 'unknown')}: {str(e)}"
+                            }
+                        }) + b'\n'
                 
         except Exception as e:
-            yield json.dumps({
+            yield orjson.dumps({
                 'status': {
                     'success': False,
                     'message': f"Error processing bulk emails: {str(e)}"
                 }
-            }) + '\n'
+            }) + b'\n'
 
     return Response(stream_with_context(generate()), mimetype='application/json')
 
+SCHEDULED_CACHE_TTL = 1.0  # Seconds a built scheduled-email listing is reused
+scheduled_generation = 0  # Bumped whenever a scheduled email job is added or removed
+scheduled_cache = None  # (generation, built_at, scheduled_emails)
+
+def invalidate_scheduled_cache(event):
+    global scheduled_generation
+    if event.jobstore == 'default':
+        scheduled_generation += 1
+
+scheduler.add_listener(invalidate_scheduled_cache, EVENT_JOB_ADDED | EVENT_JOB_REMOVED | EVENT_JOB_MODIFIED)
+
+def list_scheduled_emails():
+    """Return all pending scheduled emails, reusing a recent listing if no jobs changed"""
+    global scheduled_cache
+    now = time.monotonic()
+    cache = scheduled_cache
+    if cache and cache[0] == scheduled_generation and now - cache[1] < SCHEDULED_CACHE_TTL:
+        return cache[2]
+    generation = scheduled_generation
+    scheduled_emails = [{
+        'id': job.id,
+        'recipient': job.args[0],
+        'subject': job.args[1],
+        'scheduled_time': job.next_run_time.isoformat(),
+        'status': 'Pending'
+    } for job in scheduler.get_jobs(jobstore='default')]
+    scheduled_cache = (generation, now, scheduled_emails)
+    return scheduled_emails
+
 @app.route('/get-scheduled-emails', methods=['GET'])
 def get_scheduled_emails():
-    scheduled_emails = []
-    for job_id, job in SCHEDULED_JOBS.items():
-        scheduled_emails.append({
-            'id': job_id,
-            'recipient': job['recipient'],
-            'subject': job['subject'],
-            'scheduled_time': job['scheduled_time'].strftime("%Y-%m-%d %H:%M"),
-            'status': 'Pending'
-        })
-    return jsonify({'success': True, 'scheduled_emails': scheduled_emails})
+    """Return scheduled emails, optionally paginated with ?limit=&offset="""
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', type=int)
+    if offset < 0 or (limit is not None and limit < 0):
+        return jsonify({
+            'success': False,
+            'message': 'limit and offset must not be negative'
+        }), 400
+    scheduled_emails = list_scheduled_emails()
+    page = scheduled_emails[offset:offset + limit if limit is not None else None]
+    return Response(orjson.dumps({
+        'success': True,
+        'total': len(scheduled_emails),
+        'scheduled_emails': page
+    }), mimetype='application/json')
 
 @app.route('/cancel-scheduled-email/<job_id>', methods=['POST'])
 def cancel_scheduled_email(job_id):
-    if job_id in SCHEDULED_JOBS:
-        scheduler.remove_job(job_id)
-        del SCHEDULED_JOBS[job_id]
+    job = scheduler.get_job(job_id, jobstore='default')
+    try:
+        scheduler.remove_job(job_id, jobstore='default')
+        # The cancelled job never runs, so clean up the upload it owned
+        remove_job_upload(job.args[3])
         return jsonify({'success': True, 'message': 'Email cancelled successfully'})
-    return jsonify({'success': False, 'message': 'Scheduled email not found'})
+    except JobLookupError:
+        return jsonify({'success': False, 'message': 'Scheduled email not found'})
 
 @app.route('/scheduled-emails')
 def scheduled_emails():
@@ -479,6 +843,7 @@ def quick_add():
     return render_template('quick_add.html')
 
 @app.route('/send-quick-add-emails', methods=['POST'])
+@limiter.limit(RATE_LIMIT)
 def send_quick_add_emails():
     """Handle quick add recipients email sending"""
     def generate():
@@ -486,124 +851,126 @@ def send_quick_add_emails():
             contentType = request.form.get('contentType', 'custom')
             attachment = request.files.get('attachment')
             
-            # Parse recipients from form data
-            recipients = []
+            # Parse recipients from form data in a single pass, grouping
+            # keys like "recipients[1][name]" by their index
+            by_index = defaultdict(dict)
             for key, value in request.form.items():
-                if key.startswith('recipients[') and key.endswith('][name]'):
-                    # Extract index from key like "recipients[1][name]"
-                    index = key.split('[')[1].split(']')[0]
-                    name = value
-                    email_key = f'recipients[{index}][email]'
-                    email = request.form.get(email_key)
-                    
-                    if name and email:
-                        recipients.append({'name': name, 'email': email})
+                match = RECIPIENT_FIELD_PATTERN.match(key)
+                if match:
+                    by_index[match[1]][match[2]] = value
+            recipients = [r for r in by_index.values() if r.get('name') and r.get('email')]
             
             if not recipients:
-                yield json.dumps({
+                yield orjson.dumps({
                     'status': {'success': False, 'message': 'No recipients found'}
-                }) + '\n'
+                }) + b'\n'
                 return
             
             total_emails = len(recipients)
             
-            # Save attachment if provided
-            attachment_path = None
-            if attachment and attachment.filename:
-                if allowed_file(attachment.filename):
-                    filename = secure_filename(attachment.filename)
-                    attachment_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                    attachment.save(attachment_path)
-
-            # Get email content based on type
-            if contentType == 'custom':
-                # Use custom subject and body
-                subject = request.form.get('subject', '')
-                body = request.form.get('body', '')
-                template_attachment = None
-            else:
-                # Use template
-                template_name = request.form.get('template')
-                template = EMAIL_TEMPLATES.get(template_name)
-                if not template:
-                    yield json.dumps({
-                        'status': {'success': False, 'message': 'Template not found'}
-                    }) + '\n'
-                    return
-                subject = template['subject']
-                body = template['body']
-                # Get template attachment
-                if template.get('attachment_name'):
-                    template_attachment = os.path.join(
-                        TEMPLATE_ATTACHMENTS_DIR, 
-                        template['attachment_name']
-                    )
-                else:
+            # Save attachment if provided; it is removed when the block exits
+            with saved_upload(attachment) as (attachment_path, attachment_filename):
+                # Get email content based on type
+                if contentType == 'custom':
+                    # Use custom subject and body
+                    subject = request.form.get('subject', '')
+                    body = request.form.get('body', '')
                     template_attachment = None
-
-            # Process each email
-            for index, recipient in enumerate(recipients):
-                try:
+                    template_filename = None
+                    template_key = None
+                else:
+                    # Use template
+                    template_name = request.form.get('template')
+                    template = EMAIL_TEMPLATES.get(template_name)
+                    if not template:
+                        yield orjson.dumps({
+                            'status': {'success': False, 'message': 'Template not found'}
+                        }) + b'\n'
+                        return
+                    subject = template['subject']
+                    body = template['body']
+                    # Get template attachment
+                    if template.get('attachment_name'):
+                        template_attachment = os.path.join(
+                            TEMPLATE_ATTACHMENTS_DIR, 
+                            template['attachment_name']
+                        )
+                    else:
+                        template_attachment = None
+                    template_filename = template.get('attachment_filename')
+                    template_key = template_attachment_key(template)
+
+                # Split subject and body around [name] once; line breaks are
+                # converted to HTML up front since they don't depend on the name
+                subject_parts = subject.split('[name]')
+                body_parts = body.replace('\n', '<br>').split('[name]')
+
+                # Use custom attachment or template attachment
+                final_attachment = attachment_path or template_attachment
+                final_filename = attachment_filename if attachment_path else template_filename
+                cache_key = None if attachment_path else template_key
+
+                # Build the message parts once; headers and body are personalized per recipient
+                message = email_sender.message_template(subject, body, final_attachment,
+                                                        final_filename, cache_key)
+
+                def send_recipient(recipient, smtp):
                     email = recipient['email']
                     name = recipient['name']
-                    
+                
                     # Personalize subject and body
                     personalized_subject = subject
                     personalized_body = body
-                    
+                
                     if name:
                         # Replace [name] with actual name in both subject and body
-                        personalized_subject = subject.replace('[name]', name)
-                        personalized_body = body.replace('[name]', name)
-                        # Convert line breaks to HTML format
-                        personalized_body = personalized_body.replace('\n', '<br>')
+                        personalized_subject = name.join(subject_parts)
                         # Always add "Hello [name]" at the beginning
-                        personalized_body = f"Hello {name},<br><br>{personalized_body}"
-                    
-                    # Use custom attachment or template attachment
-                    final_attachment = attachment_path or template_attachment
-                    
-                    # Send email
-                    success, error = email_sender.send_email(
+                        personalized_body = f"Hello {name},<br><br>{name.join(body_parts)}"
+                
+                    return email_sender.send_from_template(
+                        message,
                         recipient=email,
                         subject=personalized_subject,
                         body=personalized_body,
-                        attachment_path=final_attachment
+                        session=smtp
                     )
+
+                # Process each email
+                for index, (recipient, future) in enumerate(send_concurrently(recipients, send_recipient)):
+                    try:
+                        success, error = future.result()
                     
-                    # Report status
-                    status_message = f"Email to {name} ({email}): {'Success' if success else error}"
-                    yield json.dumps({
-                        'progress': ((index + 1) / total_emails) * 100,
-                        'current': index + 1,
-                        'total': total_emails,
-                        'status': {
-                            'success': success,
-                            'message': status_message
-                        }
-                    }) + '\n'
+                        # Report status
+                        status_message = f"Email to {recipient['name']} ({recipient['email']}): {'Success' if success else error}"
+                        yield orjson.dumps({
+                            'progress': ((index + 1) / total_emails) * 100,
+                            'current': index + 1,
+                            'total': total_emails,
+                            'status': {
+                                'success': success,
+                                'message': status_message
+                            }
+                        }) + b'\n'
                     
-                except Exception as e:
-                    yield json.dumps({
-                        'status': {
-                            'success': False,
-                            'message': f"Error processing {recipient.get('email', 'unknown')}: {str(e)}"
-                        }
-                    }) + '\n'
-
-            # Clean up temporary attachment
-            if attachment_path and os.path.exists(attachment_path):
-                os.remove(attachment_path)
+                    except Exception as e:
+                        yield orjson.dumps({
+                            'status': {
+                                'success': False,
+                                'message': f"Error processing {recipient.get('email', 'unknown')}: {str(e)}"
+                            }
+                        }) + b'\n'
                 
         except Exception as e:
-            yield json.dumps({
+            yield orjson.dumps({
                 'status': {
                     'success': False,
                     'message': f"Error processing quick add emails: {str(e)}"
                 }
-            }) + '\n'
+            }) + b'\n'
 
     return Response(stream_with_context(generate()), mimetype='application/json')
 
 if __name__ == '__main__':
-    app.run(debug=True) 
\ No newline at end of file
+    # The reloader would import the app twice and start a second scheduler
+    app.run(debug=True, use_reloader=False) 
\ No newline at end of file
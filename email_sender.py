@@ -2,8 +2,17 @@ import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
+from email import encoders
 from typing import Optional
+import base64
+import threading
+from collections import OrderedDict
 import os
+import re
+import time
+
+EMAIL_PATTERN = re.compile(r'[^@\s]+@[^@\s]+\.[^@\s]+').fullmatch
+THROTTLED_ERROR = "Server is limiting connections (421). Try again later."
 
 class EmailConfig:
     """Email configuration settings"""
@@ -20,6 +29,136 @@ class EmailConfig:
         if not cls.SENDER_PASSWORD:
             raise ValueError("SENDER_PASSWORD environment variable is required")
 
+def encode_attachment(attachment_path: str) -> str:
+    """Read a file and base64-encode it for a MIME part"""
+    with open(attachment_path, "rb") as f:
+        return base64.encodebytes(f.read()).decode('ascii')
+
+class AttachmentCache:
+    """Encoded attachments kept in memory, evicted least recently used first
+    once their total size exceeds ``max_bytes``"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str, attachment_path: str) -> str:
+        """Return the encoded file for ``key``, reading ``attachment_path`` on a miss"""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        encoded = encode_attachment(attachment_path)
+        if len(encoded) <= self.max_bytes:
+            with self.lock:
+                if key not in self.entries:
+                    self.entries[key] = encoded
+                    self.size += len(encoded)
+                while self.size > self.max_bytes:
+                    _, evicted = self.entries.popitem(last=False)
+                    self.size -= len(evicted)
+        return encoded
+
+# Only template attachments are cached; one-off uploads are read once and dropped
+ATTACHMENT_CACHE = AttachmentCache(max_bytes=64 * 1024 * 1024)
+
+class SMTPSession:
+    """Persistent, authenticated SMTP connection reused across several sends"""
+
+    KEEPALIVE_INTERVAL = 60  # Seconds of idleness before probing with NOOP
+
+    def __init__(self, config: EmailConfig = EmailConfig):
+        self.config = config
+        self.server = None
+        self.last_used = 0.0
+
+    def connect(self):
+        """Open the connection, enable TLS and log in"""
+        server = smtplib.SMTP(self.config.SMTP_SERVER, self.config.SMTP_PORT)
+        try:
+            server.starttls()  # Enable TLS
+            server.login(self.config.SENDER_EMAIL, self.config.SENDER_PASSWORD)
+        except BaseException:
+            # Never keep a connection that isn't encrypted and authenticated
+            server.close()
+            raise
+        self.server = server
+        self.last_used = time.monotonic()
+
+    def ensure_connected(self):
+        """Connect lazily and probe idle connections with NOOP"""
+        if self.server is None:
+            self.connect()
+        elif time.monotonic() - self.last_used > self.KEEPALIVE_INTERVAL:
+            try:
+                status, _ = self.server.noop()
+            except OSError:  # Includes SMTPException and socket errors
+                status = None
+            if status != 250:
+                self.close()
+                self.connect()
+
+    def sendmail(self, recipient: str, msg_bytes: bytes):
+        """Send pre-serialized message bytes, reconnecting once if the server dropped us"""
+        self.ensure_connected()
+        try:
+            self.server.sendmail(self.config.SENDER_EMAIL, recipient, msg_bytes)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            self.connect()
+            self.server.sendmail(self.config.SENDER_EMAIL, recipient, msg_bytes)
+        except smtplib.SMTPException:
+            raise
+        except OSError:
+            # The socket itself failed; reconnect on the next send
+            self.close()
+            raise
+        self.last_used = time.monotonic()
+
+    def close(self):
+        """Quit the connection, ignoring servers that already went away"""
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except OSError:  # Includes SMTPException and socket errors
+                self.server.close()
+            self.server = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class MessageTemplate:
+    """Message parts shared across recipients
+
+    The HTML body and PDF parts are built once; render() only creates the
+    outer multipart container and its headers, plus a new body part when
+    the body is personalized. Shared parts are never mutated, so a template
+    can be rendered from several threads at once.
+    """
+
+    def __init__(self, sender: str, subject: str, body: str, attachment: Optional[MIMEApplication] = None):
+        self.sender = sender
+        self.subject = subject
+        self.body_part = MIMEText(body, "html")
+        self.attachment = attachment
+
+    def render(self, recipient: str, subject: Optional[str] = None, body: Optional[str] = None) -> MIMEMultipart:
+        """Return a message for one recipient, optionally overriding subject and body"""
+        msg = MIMEMultipart('alternative')
+        msg["From"] = self.sender
+        msg["To"] = recipient
+        msg["Subject"] = self.subject if subject is None else subject
+        # Add body as HTML
+        msg.attach(self.body_part if body is None else MIMEText(body, "html"))
+        if self.attachment is not None:
+            msg.attach(self.attachment)
+        return msg
+
 class EmailSender:
     """Handles email sending operations"""
     
@@ -30,9 +169,92 @@ class EmailSender:
 
     def validate_email(self, email: str) -> bool:
         """Basic email format validation"""
-        return '@' in email and '.' in email.split('@')[1]
+        return EMAIL_PATTERN(email) is not None
+
+    def load_attachment(self, attachment_path: str, filename: Optional[str] = None,
+                        cache_key: Optional[str] = None) -> MIMEApplication:
+        """
+        Build the MIME attachment part for a PDF
+
+        Args:
+            attachment_path: Path to the PDF
+            filename: Optional name shown for the attachment (defaults to the file name)
+            cache_key: Key identifying the file's content (e.g. its hash); when
+                given, the encoded file is kept in ATTACHMENT_CACHE
+        """
+        if cache_key:
+            encoded = ATTACHMENT_CACHE.get(cache_key, attachment_path)
+        else:
+            encoded = encode_attachment(attachment_path)
+        pdf = MIMEApplication(encoded, _subtype="pdf", _encoder=encoders.encode_noop)
+        pdf['Content-Transfer-Encoding'] = 'base64'
+        pdf.add_header('Content-Disposition', 'attachment',
+                       filename=filename or os.path.basename(attachment_path))
+        return pdf
+
+    def open_session(self) -> SMTPSession:
+        """Return an SMTP session to reuse for a batch of sends (use as a context manager)"""
+        return SMTPSession(self.config)
+
+    def send_on(self, session: SMTPSession, recipient: str, msg: MIMEMultipart) -> tuple[bool, Optional[str]]:
+        """Send a built message over an open session"""
+        try:
+            # SMTP requires CRLF line endings; sendmail() only fixes them up for str
+            session.sendmail(recipient, msg.as_bytes(policy=msg.policy.clone(linesep='\r\n')))
+            return True, None
+
+        except smtplib.SMTPAuthenticationError:
+            return False, "Authentication failed. Check your email and app password."
+        except smtplib.SMTPResponseException as e:
+            if e.smtp_code == 421:
+                return False, THROTTLED_ERROR
+            return False, f"SMTP error occurred: {str(e)}"
+        except smtplib.SMTPException as e:
+            return False, f"SMTP error occurred: {str(e)}"
+        except Exception as e:
+            return False, f"An unexpected error occurred: {str(e)}"
+
+    def message_template(self, subject: str, body: str, attachment_path: Optional[str] = None,
+                         attachment_filename: Optional[str] = None,
+                         attachment_cache_key: Optional[str] = None) -> MessageTemplate:
+        """Build the parts of a message once so it can be sent to many recipients"""
+        attachment = None
+        if attachment_path:
+            try:
+                attachment = self.load_attachment(attachment_path, attachment_filename, attachment_cache_key)
+            except FileNotFoundError:
+                pass
+        return MessageTemplate(self.config.SENDER_EMAIL, subject, body, attachment)
+
+    def send_from_template(self, template: MessageTemplate, recipient: str, subject: Optional[str] = None,
+                           body: Optional[str] = None, session: Optional[SMTPSession] = None) -> tuple[bool, Optional[str]]:
+        """
+        Send a pre-built message template to one recipient
+
+        Args:
+            template: Message template from message_template()
+            recipient: Recipient email address
+            subject: Optional personalized subject replacing the template's
+            body: Optional personalized body replacing the template's
+            session: Optional open SMTP session to reuse; a new connection is used otherwise
 
-    def send_email(self, recipient: str, subject: str, body: str, attachment_path: Optional[str] = None) -> tuple[bool, Optional[str]]:
+        Returns:
+            tuple: (success_status, error_message if any)
+        """
+        # Validate recipient email
+        if not self.validate_email(recipient):
+            return False, "Invalid recipient email address"
+
+        msg = template.render(recipient, subject, body)
+        if session is not None:
+            return self.send_on(session, recipient, msg)
+        with self.open_session() as session:
+            return self.send_on(session, recipient, msg)
+
+    def send_email(self, recipient: str, subject: str, body: str, attachment_path: Optional[str] = None,
+                   session: Optional[SMTPSession] = None,
+                   attachment_filename: Optional[str] = None,
+                   attachment_cache_key: Optional[str] = None) -> tuple[bool, Optional[str]]:
         """
         Send an email using Gmail SMTP
         
@@ -41,51 +263,45 @@ class EmailSender:
             subject: Email subject
             body: Email body content
             attachment_path: Optional path to PDF attachment
+            session: Optional open SMTP session to reuse; a new connection is used otherwise
+            attachment_filename: Optional name shown for the attachment (defaults to the file name)
+            attachment_cache_key: Optional content key to cache the encoded attachment under
             
         Returns:
             tuple: (success_status, error_message if any)
         """
-        # Validate recipient email
-        if not self.validate_email(recipient):
-            return False, "Invalid recipient email address"
+        try:
+            template = self.message_template(subject, body, attachment_path, attachment_filename,
+                                             attachment_cache_key)
+        except Exception as e:
+            return False, f"Error attaching PDF: {str(e)}"
 
-        # Create message
-        msg = MIMEMultipart('alternative')
-        msg["From"] = self.config.SENDER_EMAIL
-        msg["To"] = recipient
-        msg["Subject"] = subject
-        # Add body as HTML
-        msg.attach(MIMEText(body, "html"))
+        return self.send_from_template(template, recipient, session=session)
 
-        # Attach PDF if provided
-        if attachment_path and os.path.exists(attachment_path):
-            try:
-                with open(attachment_path, "rb") as f:
-                    pdf = MIMEApplication(f.read(), _subtype="pdf")
-                    pdf.add_header('Content-Disposition', 'attachment', 
-                                 filename=os.path.basename(attachment_path))
-                    msg.attach(pdf)
-            except Exception as e:
-                return False, f"Error attaching PDF: {str(e)}"
+    def send_emails(self, recipients: list[str], subject: str, body: str, attachment_path: Optional[str] = None) -> list[tuple[str, bool, Optional[str]]]:
+        """
+        Send the same email to several recipients over one SMTP connection
 
-        try:
-            # Connect to Gmail SMTP Server
-            server = smtplib.SMTP(self.config.SMTP_SERVER, self.config.SMTP_PORT)
-            server.starttls()  # Enable TLS
-            
-            # Login and send
-            server.login(self.config.SENDER_EMAIL, self.config.SENDER_PASSWORD)
-            server.sendmail(self.config.SENDER_EMAIL, recipient, msg.as_string())
-            server.quit()
-            
-            return True, None
+        The body and attachment parts are built once and shared by every
+        message; only the headers are created per recipient.
 
-        except smtplib.SMTPAuthenticationError:
-            return False, "Authentication failed. Check your email and app password."
-        except smtplib.SMTPException as e:
-            return False, f"SMTP error occurred: {str(e)}"
+        Args:
+            recipients: Recipient email addresses
+            subject: Email subject
+            body: Email body content
+            attachment_path: Optional path to PDF attachment
+
+        Returns:
+            list: (recipient, success_status, error_message if any) per recipient
+        """
+        try:
+            template = self.message_template(subject, body, attachment_path)
         except Exception as e:
-            return False, f"An unexpected error occurred: {str(e)}"
+            return [(recipient, False, f"Error attaching PDF: {str(e)}") for recipient in recipients]
+
+        with self.open_session() as session:
+            return [(recipient, *self.send_from_template(template, recipient, session=session))
+                    for recipient in recipients]
 
 def main():
     """Example usage"""
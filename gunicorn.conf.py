@@ -0,0 +1,16 @@
+import os
+
+# Gunicorn settings: threaded worker so SMTP sends don't block each other
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+# One worker process: templates, the scheduler, cached attachments and the
+# in-memory rate limit counters live in its memory, so extra processes would
+# each see a different copy (running more needs RATELIMIT_STORAGE_URI set to a
+# shared store). Scale with threads instead; sends mostly wait on SMTP.
+workers = 1
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+timeout = 120  # Bulk sends stream progress for a while
+
+# Import the app in the worker, after the fork, so the scheduler's thread and
+# locks are created there rather than in the master
+preload_app = False